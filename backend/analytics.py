@@ -0,0 +1,234 @@
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from database import database
+
+# Columns pulled from the projects collection. project_data is deliberately
+# left out so the export never touches the heavy document payloads.
+PROJECT_COLUMNS = [
+    "id", "user_id", "template_id", "title", "category", "difficulty", "mode",
+    "current_step", "progress", "is_completed", "created_at", "updated_at"
+]
+PROJECT_PROJECTION = {"_id": 0, **{column: 1 for column in PROJECT_COLUMNS}}
+STRING_COLUMNS = ["id", "user_id", "template_id", "title", "category", "difficulty", "mode"]
+CATEGORY_COLUMNS = ["template_id", "title", "category", "difficulty", "mode"]
+
+BATCH_SIZE = int(os.environ.get("ANALYTICS_BATCH_SIZE", "50000"))
+CACHE_TTL_SECONDS = int(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+PARQUET_CHUNK_BYTES = 1024 * 1024
+# Step count assumed for projects whose template no longer exists,
+# matching the ProjectTemplate.total_steps default
+DEFAULT_TOTAL_STEPS = 10
+
+
+def frame_from_documents(documents: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Build a typed frame from a batch of project documents.
+
+    Every batch comes out with the same columns and dtypes so chunks can be
+    concatenated or written as consecutive Parquet row groups.
+    """
+    frame = pd.DataFrame.from_records(documents, columns=PROJECT_COLUMNS)
+    frame[STRING_COLUMNS] = frame[STRING_COLUMNS].fillna("").astype(str)
+    frame["current_step"] = frame["current_step"].fillna(0).astype(np.int32)
+    frame["progress"] = frame["progress"].fillna(0).astype(np.int16)
+    frame["is_completed"] = frame["is_completed"].fillna(False).astype(bool)
+    frame["created_at"] = pd.to_datetime(frame["created_at"])
+    frame["updated_at"] = pd.to_datetime(frame["updated_at"])
+    return frame
+
+
+def with_time_to_complete(frame: pd.DataFrame) -> pd.DataFrame:
+    # updated_at is bumped on every save, so for completed projects it is the
+    # completion time unless the kid kept editing afterwards.
+    seconds = (frame["updated_at"] - frame["created_at"]).dt.total_seconds()
+    frame["time_to_complete_seconds"] = seconds.where(frame["is_completed"])
+    return frame
+
+
+def step_funnels(frame: pd.DataFrame, total_steps: Dict[str, int]) -> List[Dict[str, Any]]:
+    """Per-template count of projects that reached and stalled at each step."""
+    if frame.empty:
+        return []
+
+    # current_step is client supplied; clip it to the template's step range
+    # so one bogus value cannot blow up the step columns
+    upper = frame["template_id"].astype(object).map(total_steps).fillna(DEFAULT_TOTAL_STEPS)
+    frame = frame.assign(current_step=frame["current_step"].clip(lower=0, upper=upper).astype(np.int32))
+
+    at_step = frame.groupby(["template_id", "current_step"], observed=True).size().unstack(fill_value=0)
+    last_step = {
+        template_id: int(total_steps.get(template_id, DEFAULT_TOTAL_STEPS))
+        for template_id in at_step.index
+    }
+    at_step = at_step.reindex(columns=range(max(last_step.values()) + 1), fill_value=0)
+    # A project sitting at step N has passed through every step before it
+    reached = at_step.iloc[:, ::-1].cumsum(axis=1).iloc[:, ::-1]
+    stalled = (
+        frame[~frame["is_completed"]]
+        .groupby(["template_id", "current_step"], observed=True).size()
+        .unstack(fill_value=0)
+        .reindex(index=at_step.index, columns=at_step.columns, fill_value=0)
+    )
+    titles = frame.groupby("template_id", observed=True)["title"].first()
+
+    # Each template only reports its own steps, not the widest template's
+    steps = at_step.columns.to_numpy()
+    return [
+        {
+            "template_id": template_id,
+            "title": titles.get(template_id, ""),
+            "steps": [
+                {"step": int(step), "reached": int(r), "stalled": int(s)}
+                for step, r, s in zip(
+                    steps[:last_step[template_id] + 1],
+                    reached.loc[template_id].to_numpy(),
+                    stalled.loc[template_id].to_numpy()
+                )
+            ]
+        }
+        for template_id in at_step.index
+    ]
+
+
+def completion_rates(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Started/completed counts and completion rate per category and difficulty."""
+    if frame.empty:
+        return []
+
+    rates = (
+        frame.groupby(["category", "difficulty"], observed=True)["is_completed"]
+        .agg(started="size", completed="sum", completion_rate="mean")
+        .reset_index()
+    )
+    return json.loads(rates.to_json(orient="records"))
+
+
+def time_to_complete(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Time-to-complete distribution per template, in seconds."""
+    completed = frame.loc[frame["is_completed"], ["template_id", "title", "time_to_complete_seconds"]]
+    if completed.empty:
+        return []
+
+    grouped = completed.groupby("template_id", observed=True)["time_to_complete_seconds"]
+    stats = grouped.agg(completed="size", mean_seconds="mean", median_seconds="median")
+    stats["p90_seconds"] = grouped.quantile(0.9)
+    stats["title"] = completed.groupby("template_id", observed=True)["title"].first()
+    return json.loads(stats.reset_index().to_json(orient="records"))
+
+
+def build_frame(documents: List[Dict[str, Any]]) -> pd.DataFrame:
+    return with_time_to_complete(frame_from_documents(documents))
+
+
+def combine_frames(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    if not chunks:
+        return build_frame([])
+    frame = pd.concat(chunks, ignore_index=True)
+    # Low-cardinality columns become categoricals so millions of rows
+    # stay small in memory while the aggregates run
+    frame[CATEGORY_COLUMNS] = frame[CATEGORY_COLUMNS].astype("category")
+    return frame
+
+
+def write_row_group(writer, buffer, frame: pd.DataFrame):
+    """Append frame to the Parquet buffer as a row group, opening the writer on first use."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if writer is None:
+        writer = pq.ParquetWriter(buffer, table.schema, compression="snappy")
+    writer.write_table(table)
+    return writer
+
+
+def summarize(frame: pd.DataFrame, total_steps: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "total_projects": int(len(frame)),
+        "completed_projects": int(frame["is_completed"].sum()),
+        "step_funnels": step_funnels(frame, total_steps),
+        "completion_rates": completion_rates(frame),
+        "time_to_complete": time_to_complete(frame)
+    }
+
+
+class ProjectAnalytics:
+    def __init__(self, batch_size: int = BATCH_SIZE, cache_ttl: int = CACHE_TTL_SECONDS):
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self._summary: Optional[Dict[str, Any]] = None
+        self._summary_expires = 0.0
+        self._lock = asyncio.Lock()
+
+    # Building, combining and serializing frames is CPU bound, as are the
+    # aggregates; all of it runs in the executor so exports of millions of
+    # rows never stall the event loop
+    async def iter_frames(self) -> AsyncIterator[pd.DataFrame]:
+        loop = asyncio.get_running_loop()
+        async for documents in database.iter_project_batches(PROJECT_PROJECTION, batch_size=self.batch_size):
+            yield await loop.run_in_executor(None, build_frame, documents)
+
+    async def load_frame(self) -> pd.DataFrame:
+        chunks = []
+        async for frame in self.iter_frames():
+            chunks.append(frame)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, combine_frames, chunks)
+
+    async def get_summary(self, refresh: bool = False) -> Dict[str, Any]:
+        if not refresh and self._summary is not None and time.monotonic() < self._summary_expires:
+            return self._summary
+
+        async with self._lock:
+            # Another request may have rebuilt the summary while we waited
+            if not refresh and self._summary is not None and time.monotonic() < self._summary_expires:
+                return self._summary
+
+            frame = await self.load_frame()
+            total_steps = {template.id: template.total_steps for template in await database.get_all_templates()}
+            loop = asyncio.get_running_loop()
+            self._summary = await loop.run_in_executor(None, summarize, frame, total_steps)
+            self._summary_expires = time.monotonic() + self.cache_ttl
+            return self._summary
+
+    async def stream_csv(self) -> AsyncIterator[str]:
+        loop = asyncio.get_running_loop()
+        header = True
+        async for frame in self.iter_frames():
+            yield await loop.run_in_executor(None, functools.partial(frame.to_csv, index=False, header=header))
+            header = False
+        if header:
+            yield await loop.run_in_executor(None, functools.partial(build_frame([]).to_csv, index=False))
+
+    async def stream_parquet(self) -> AsyncIterator[bytes]:
+        loop = asyncio.get_running_loop()
+        # Parquet needs its footer written before the file is readable, so
+        # row groups are spooled (to disk past 64MB) and streamed afterwards.
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as buffer:
+            writer = None
+            async for frame in self.iter_frames():
+                writer = await loop.run_in_executor(None, write_row_group, writer, buffer, frame)
+            if writer is None:
+                writer = await loop.run_in_executor(None, write_row_group, None, buffer, build_frame([]))
+            await loop.run_in_executor(None, writer.close)
+
+            buffer.seek(0)
+            while True:
+                chunk = buffer.read(PARQUET_CHUNK_BYTES)
+                if not chunk:
+                    break
+                yield chunk
+
+
+# Initialize analytics instance
+analytics = ProjectAnalytics()
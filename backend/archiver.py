@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Optional
+
+from database import database
+
+logger = logging.getLogger(__name__)
+
+# Projects untouched for this many days have their project_data moved to the
+# cold project_archive collection; 0 disables the background archiver
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+ARCHIVE_INTERVAL_SECONDS = int(os.environ.get("ARCHIVE_INTERVAL_SECONDS", "3600"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+
+
+async def archive_inactive_projects(after_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=after_days)
+    archived = 0
+    async for batch in database.iter_archivable_projects(cutoff, batch_size=batch_size):
+        for project in batch:
+            if await database.archive_project_data(project):
+                archived += 1
+    logger.info(f"Archived project data of {archived} projects untouched since {cutoff.isoformat()}")
+    return archived
+
+
+class Archiver:
+    def __init__(self, after_days: int = ARCHIVE_AFTER_DAYS, interval: int = ARCHIVE_INTERVAL_SECONDS):
+        self.after_days = after_days
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.after_days <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await archive_inactive_projects(self.after_days)
+            except Exception as e:
+                logger.error(f"Error archiving inactive projects: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# Initialize archiver instance
+archiver = Archiver()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    # Usage: python archiver.py [days], defaulting to ARCHIVE_AFTER_DAYS
+    after_days = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_AFTER_DAYS
+    if after_days <= 0:
+        sys.exit("Set ARCHIVE_AFTER_DAYS or pass the number of inactive days to archive after")
+
+    async def main():
+        try:
+            await database.ensure_project_indexes()
+            await archive_inactive_projects(after_days)
+        finally:
+            await database.close()
+
+    asyncio.run(main())
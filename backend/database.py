@@ -1,8 +1,15 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import List, Optional, Dict, Any
+from pymongo import ReplaceOne
+from pymongo.errors import DuplicateKeyError
+from bson import Binary, decode as bson_decode, encode as bson_encode
+from collections import deque
+from typing import List, Optional, Dict, Any, AsyncIterator
 from models import User, UserProject, ProjectTemplate, Badge, UserBadge
 import os
-from datetime import datetime
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -10,6 +17,8 @@ from pathlib import Path
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+ARCHIVE_CLAIM_TIMEOUT = timedelta(hours=1)
+
 class Database:
     def __init__(self):
         self.client = AsyncIOMotorClient(os.environ['MONGO_URL'])
@@ -19,6 +28,12 @@ class Database:
         self.templates = self.db.templates
         self.badges = self.db.badges
         self.user_badges = self.db.user_badges
+        self.template_neighbors = self.db.template_neighbors
+        self.user_recommendations = self.db.user_recommendations
+        self.project_archive = self.db.project_archive
+        self.jobs = self.db.jobs
+        # Recent rehydration latencies in seconds, for tier metrics
+        self.rehydration_timings = deque(maxlen=1000)
 
     async def close(self):
         self.client.close()
@@ -46,6 +61,13 @@ class Database:
             return await self.get_user_by_id(user_id)
         return None
 
+    async def refresh_user_counters(self, user_id: str) -> Optional[User]:
+        """Recount a user's project totals from the projects collection."""
+        return await self.update_user(user_id, {
+            "total_projects": await self.projects.count_documents({"user_id": user_id}),
+            "completed_projects": await self.projects.count_documents({"user_id": user_id, "is_completed": True})
+        })
+
     # Project Template operations
     async def create_template(self, template: ProjectTemplate) -> ProjectTemplate:
         await self.templates.insert_one(template.dict())
@@ -70,21 +92,207 @@ class Database:
 
     async def get_user_project_by_id(self, project_id: str) -> Optional[UserProject]:
         project_data = await self.projects.find_one({"id": project_id})
+        if project_data and project_data.get("project_data_archived"):
+            project_data["project_data"] = await self._rehydrate_project_data(project_id)
         return UserProject(**project_data) if project_data else None
 
+    async def get_user_project_owner(self, project_id: str) -> Optional[Dict[str, Any]]:
+        """Fields needed for access checks, without touching project_data or the cold tier."""
+        return await self.projects.find_one({"id": project_id}, {"_id": 0, "user_id": 1, "is_completed": 1})
+
     async def update_user_project(self, project_id: str, update_data: Dict[str, Any]) -> Optional[UserProject]:
         update_data["updated_at"] = datetime.utcnow()
-        result = await self.projects.update_one(
+        update = {"$set": update_data}
+        if "project_data" in update_data:
+            # New data supersedes any archived copy
+            update["$unset"] = {"project_data_archived": ""}
+        previous = await self.projects.find_one_and_update(
             {"id": project_id},
-            {"$set": update_data}
+            update,
+            projection={"_id": 0, "id": 1, "project_data_archived": 1}
         )
-        if result.modified_count:
-            return await self.get_user_project_by_id(project_id)
-        return None
+        if previous is None:
+            return None
+        if "project_data" in update_data and previous.get("project_data_archived"):
+            await self.project_archive.delete_one({"project_id": project_id})
+        return await self.get_user_project_by_id(project_id)
 
     async def delete_user_project(self, project_id: str) -> bool:
-        result = await self.projects.delete_one({"id": project_id})
-        return result.deleted_count > 0
+        deleted = await self.projects.find_one_and_delete(
+            {"id": project_id},
+            projection={"_id": 0, "id": 1, "project_data_archived": 1}
+        )
+        if deleted is None:
+            return False
+        if deleted.get("project_data_archived"):
+            await self.project_archive.delete_one({"project_id": project_id})
+        return True
+
+    async def get_user_project_fields(self, user_id: str, fields: List[str]) -> List[Dict[str, Any]]:
+        projection = {"_id": 0, **{field: 1 for field in fields}}
+        return await self.projects.find({"user_id": user_id}, projection).to_list(None)
+
+    async def iter_project_batches(
+        self,
+        projection: Dict[str, Any],
+        query: Optional[Dict[str, Any]] = None,
+        batch_size: int = 10000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield raw project documents in chunks of at most batch_size."""
+        async for batch in self._iter_batches(self.projects, projection, query, batch_size):
+            yield batch
+
+    async def _iter_batches(
+        self,
+        collection,
+        projection: Dict[str, Any],
+        query: Optional[Dict[str, Any]],
+        batch_size: int
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        cursor = collection.find(query or {}, projection, batch_size=batch_size)
+        while True:
+            batch = await cursor.to_list(length=batch_size)
+            if not batch:
+                break
+            yield batch
+
+    # Project data tiering
+    async def ensure_project_indexes(self):
+        # The archiver scans by updated_at and the tier stats count the stubs
+        await self.projects.create_index("updated_at")
+        await self.projects.create_index(
+            "project_data_archived",
+            partialFilterExpression={"project_data_archived": True}
+        )
+
+    async def iter_archivable_projects(self, cutoff: datetime, batch_size: int = 500) -> AsyncIterator[List[Dict[str, Any]]]:
+        # Recently rehydrated projects are being used again and stay hot
+        query = {
+            "updated_at": {"$lt": cutoff},
+            "project_data_archived": {"$ne": True},
+            "project_data": {"$exists": True, "$nin": [{}, None]},
+            "$or": [{"rehydrated_at": {"$exists": False}}, {"rehydrated_at": {"$lt": cutoff}}]
+        }
+        async for batch in self.iter_project_batches(
+            {"_id": 0, "id": 1, "updated_at": 1, "rehydrated_at": 1, "project_data": 1},
+            query=query,
+            batch_size=batch_size
+        ):
+            yield batch
+
+    async def archive_project_data(self, project: Dict[str, Any]) -> bool:
+        """Move a project's project_data into the compressed cold collection.
+
+        The hot document is first claimed with a per-attempt token, so only
+        one archiver writes the cold copy. It then gets an empty project_data
+        and a project_data_archived flag. The move is abandoned if the project
+        was saved or rehydrated after it was read, and the rollback only
+        touches data carrying this attempt's token.
+        """
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        unchanged = {
+            "id": project["id"],
+            "updated_at": project["updated_at"],
+            "rehydrated_at": project.get("rehydrated_at"),
+            "project_data_archived": {"$ne": True}
+        }
+        # Claims left behind by a crashed archiver expire after an hour
+        claimed = await self.projects.update_one(
+            {**unchanged, "$or": [
+                {"archive_claim": {"$exists": False}},
+                {"archive_claim.at": {"$lt": now - ARCHIVE_CLAIM_TIMEOUT}}
+            ]},
+            {"$set": {"archive_claim": {"token": token, "at": now}}}
+        )
+        if not claimed.modified_count:
+            return False
+
+        raw = bson_encode({"project_data": project["project_data"]})
+        await self.project_archive.replace_one(
+            {"project_id": project["id"]},
+            {
+                "project_id": project["id"],
+                "archive_token": token,
+                "data": Binary(zlib.compress(raw)),
+                "size": len(raw),
+                "archived_at": now
+            },
+            upsert=True
+        )
+        result = await self.projects.update_one(
+            {**unchanged, "archive_claim.token": token},
+            {"$set": {"project_data": {}, "project_data_archived": True}, "$unset": {"archive_claim": ""}}
+        )
+        if not result.modified_count:
+            await self.project_archive.delete_one({"project_id": project["id"], "archive_token": token})
+            await self.projects.update_one(
+                {"id": project["id"], "archive_claim.token": token},
+                {"$unset": {"archive_claim": ""}}
+            )
+            return False
+        return True
+
+    async def _rehydrate_project_data(self, project_id: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        archived = await self.project_archive.find_one({"project_id": project_id})
+        if archived is None:
+            # Rehydrated or overwritten by a concurrent request
+            current = await self.projects.find_one({"id": project_id}, {"_id": 0, "project_data": 1})
+            return current.get("project_data", {}) if current else {}
+        project_data = bson_decode(zlib.decompress(archived["data"]))["project_data"]
+        result = await self.projects.update_one(
+            {"id": project_id, "project_data_archived": True},
+            {
+                "$set": {"project_data": project_data, "rehydrated_at": datetime.utcnow()},
+                "$unset": {"project_data_archived": ""}
+            }
+        )
+        if result.modified_count:
+            await self.project_archive.delete_one({"project_id": project_id})
+            self.rehydration_timings.append(time.perf_counter() - started)
+            return project_data
+        # Another request rehydrated or saved first; its data is current
+        current = await self.projects.find_one({"id": project_id}, {"_id": 0, "project_data": 1})
+        return current.get("project_data", {}) if current else {}
+
+    async def get_tier_stats(self) -> Dict[str, Any]:
+        cold = await self.project_archive.aggregate([
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "raw_bytes": {"$sum": "$size"},
+                "compressed_bytes": {"$sum": {"$binarySize": "$data"}}
+            }}
+        ]).to_list(None)
+        cold = cold[0] if cold else {"count": 0, "raw_bytes": 0, "compressed_bytes": 0}
+        hot_stats = await self.db.command("collStats", "projects")
+        timings = sorted(self.rehydration_timings)
+
+        def percentile(fraction: float) -> Optional[float]:
+            if not timings:
+                return None
+            return round(timings[min(int(len(timings) * fraction), len(timings) - 1)] * 1000, 3)
+
+        return {
+            "hot": {
+                "projects": hot_stats.get("count", 0),
+                "archived_stubs": await self.projects.count_documents({"project_data_archived": True}),
+                "data_bytes": hot_stats.get("size", 0),
+                "index_bytes": hot_stats.get("totalIndexSize", 0)
+            },
+            "cold": {
+                "projects": cold["count"],
+                "raw_bytes": cold["raw_bytes"],
+                "compressed_bytes": cold["compressed_bytes"]
+            },
+            "rehydration": {
+                "recent_count": len(timings),
+                "p50_ms": percentile(0.5),
+                "p95_ms": percentile(0.95),
+                "max_ms": percentile(1.0)
+            }
+        }
 
     # Badge operations
     async def create_badge(self, badge: Badge) -> Badge:
@@ -99,11 +307,49 @@ class Database:
         badge_data = await self.badges.find_one({"id": badge_id})
         return Badge(**badge_data) if badge_data else None
 
-    async def award_badge_to_user(self, user_id: str, badge_id: str) -> UserBadge:
+    async def ensure_badge_indexes(self):
+        await self.user_badges.create_index([("user_id", 1), ("badge_id", 1)], unique=True)
+
+    async def award_badge_to_user(self, user_id: str, badge_id: str) -> Optional[UserBadge]:
         user_badge = UserBadge(user_id=user_id, badge_id=badge_id)
-        await self.user_badges.insert_one(user_badge.dict())
+        try:
+            await self.user_badges.insert_one(user_badge.dict())
+        except DuplicateKeyError:
+            # Awarded by a concurrent badge check
+            return None
         return user_badge
 
+    async def ack_unseen_badges(self, user_id: str) -> List[Badge]:
+        """Mark badges awarded since the user last looked as seen and return them.
+
+        Each award is flipped with its own find_one_and_update, so concurrent
+        callers never both get the same badge.
+        """
+        badge_ids = []
+        while True:
+            user_badge = await self.user_badges.find_one_and_update(
+                {"user_id": user_id, "seen": False},
+                {"$set": {"seen": True}},
+                projection={"_id": 0, "badge_id": 1}
+            )
+            if user_badge is None:
+                break
+            badge_ids.append(user_badge["badge_id"])
+        if not badge_ids:
+            return []
+        badges = await self.badges.find({"id": {"$in": badge_ids}}).to_list(None)
+        return [Badge(**badge) for badge in badges]
+
+    async def get_user_badge_ids(self, user_id: str) -> List[str]:
+        user_badges = await self.user_badges.find({"user_id": user_id}, {"_id": 0, "badge_id": 1}).to_list(None)
+        return [ub["badge_id"] for ub in user_badges]
+
+    async def iter_user_badge_batches(self, batch_size: int = 10000) -> AsyncIterator[List[Dict[str, Any]]]:
+        async for batch in self._iter_batches(
+            self.user_badges, {"_id": 0, "user_id": 1, "badge_id": 1}, None, batch_size
+        ):
+            yield batch
+
     async def get_user_badges(self, user_id: str) -> List[Badge]:
         user_badges = await self.user_badges.find({"user_id": user_id}).to_list(None)
         badge_ids = [ub["badge_id"] for ub in user_badges]
@@ -143,11 +389,39 @@ class Database:
                 if category_completed >= count:
                     should_award = True
 
-            if should_award:
-                await self.award_badge_to_user(user_id, badge.id)
+            if should_award and await self.award_badge_to_user(user_id, badge.id):
                 newly_awarded.append(badge)
 
         return newly_awarded
 
+    # Recommendation operations
+    async def replace_template_neighbors(self, neighbors: List[Dict[str, Any]]):
+        # Upsert in place so readers never observe an empty collection
+        if neighbors:
+            await self.template_neighbors.bulk_write([
+                ReplaceOne({"template_id": doc["template_id"]}, doc, upsert=True)
+                for doc in neighbors
+            ])
+        await self.template_neighbors.delete_many({
+            "template_id": {"$nin": [doc["template_id"] for doc in neighbors]}
+        })
+
+    async def get_template_neighbors(self) -> List[Dict[str, Any]]:
+        return await self.template_neighbors.find({}, {"_id": 0}).to_list(None)
+
+    async def ensure_recommendation_indexes(self):
+        await self.user_recommendations.create_index("user_id", unique=True)
+
+    async def save_user_recommendations(self, docs: List[Dict[str, Any]]):
+        if docs:
+            await self.user_recommendations.bulk_write([
+                ReplaceOne({"user_id": doc["user_id"]}, doc, upsert=True)
+                for doc in docs
+            ], ordered=False)
+
+    async def get_user_recommendations(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        doc = await self.user_recommendations.find_one({"user_id": user_id}, {"_id": 0, "recommendations": 1})
+        return doc["recommendations"] if doc else None
+
 # Initialize database instance
 database = Database()
\ No newline at end of file
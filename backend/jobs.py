@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import database
+from recommendations import recommender
+
+logger = logging.getLogger(__name__)
+
+# Worker coroutines started inside the API process; 0 leaves the jobs to a
+# separate `python jobs.py` worker
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "1"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1"))
+JOB_VISIBILITY_SECONDS = int(os.environ.get("JOB_VISIBILITY_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_SECONDS = float(os.environ.get("JOB_BACKOFF_SECONDS", "5"))
+JOB_MAX_BACKOFF_SECONDS = float(os.environ.get("JOB_MAX_BACKOFF_SECONDS", "600"))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+handlers: Dict[str, Handler] = {}
+
+
+def job_handler(job_type: str):
+    def register(func: Handler) -> Handler:
+        handlers[job_type] = func
+        return func
+    return register
+
+
+@job_handler("refresh_user_counters")
+async def refresh_user_counters(payload: Dict[str, Any]):
+    await database.refresh_user_counters(payload["user_id"])
+    await recommender.refresh_user(payload["user_id"])
+
+
+@job_handler("project_completed")
+async def project_completed(payload: Dict[str, Any]):
+    await database.refresh_user_counters(payload["user_id"])
+    await database.check_and_award_badges(payload["user_id"])
+    await recommender.refresh_user(payload["user_id"])
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with jitter for the given number of attempts made."""
+    delay = min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    def __init__(self, visibility_timeout: int = JOB_VISIBILITY_SECONDS):
+        self.jobs = database.jobs
+        self.visibility_timeout = visibility_timeout
+
+    async def ensure_indexes(self):
+        await self.jobs.create_index([("status", ASCENDING), ("run_at", ASCENDING)])
+        await self.jobs.create_index([("status", ASCENDING), ("locked_until", ASCENDING)])
+        await self.jobs.create_index(
+            "idempotency_key",
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}}
+        )
+        # Finished jobs are kept for a while for inspection, then dropped
+        await self.jobs.create_index(
+            "finished_at",
+            expireAfterSeconds=JOB_RETENTION_SECONDS,
+            partialFilterExpression={"status": DONE}
+        )
+
+    async def enqueue(
+        self,
+        job_type: str,
+        payload: Dict[str, Any],
+        idempotency_key: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        delay: float = 0
+    ) -> Optional[str]:
+        """Add a job to the queue.
+
+        Returns the new job id, or None when a job with the same
+        idempotency_key already exists.
+        """
+        now = datetime.utcnow()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_at": now + timedelta(seconds=delay),
+            "locked_until": None,
+            "worker_id": None,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None
+        }
+        if idempotency_key is None:
+            await self.jobs.insert_one(job)
+            return job["id"]
+
+        job["idempotency_key"] = idempotency_key
+        try:
+            result = await self.jobs.update_one(
+                {"idempotency_key": idempotency_key},
+                {"$setOnInsert": job},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent enqueue with the same key won the upsert
+            return None
+        return job["id"] if result.upserted_id is not None else None
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically lease the next due job, including ones whose lease expired."""
+        now = datetime.utcnow()
+        return await self.jobs.find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "run_at": {"$lte": now}},
+                {"status": RUNNING, "locked_until": {"$lte": now}}
+            ]},
+            {
+                "$set": {
+                    "status": RUNNING,
+                    "worker_id": worker_id,
+                    "locked_until": now + timedelta(seconds=self.visibility_timeout),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_at", ASCENDING)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _leased(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        # Only the worker holding the current lease may settle the job
+        return {"id": job["id"], "worker_id": job["worker_id"], "attempts": job["attempts"]}
+
+    async def complete(self, job: Dict[str, Any]) -> bool:
+        now = datetime.utcnow()
+        result = await self.jobs.update_one(
+            self._leased(job),
+            {"$set": {"status": DONE, "locked_until": None, "updated_at": now, "finished_at": now}}
+        )
+        return result.modified_count > 0
+
+    async def fail(self, job: Dict[str, Any], error: str) -> str:
+        """Schedule a retry with backoff, or mark the job failed once attempts run out."""
+        now = datetime.utcnow()
+        if job["attempts"] >= job["max_attempts"]:
+            update = {"status": FAILED, "finished_at": now}
+        else:
+            update = {"status": PENDING, "run_at": now + timedelta(seconds=backoff_delay(job["attempts"]))}
+        update.update({"locked_until": None, "last_error": error, "updated_at": now})
+        await self.jobs.update_one(self._leased(job), {"$set": update})
+        return update["status"]
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0, "id": 1, "type": 1, "status": 1, "payload": 1})
+
+    async def get_stats(self) -> Dict[str, Any]:
+        counts = await self.jobs.aggregate([
+            {"$group": {"_id": {"type": "$type", "status": "$status"}, "count": {"$sum": 1}}}
+        ]).to_list(None)
+        stats: Dict[str, Dict[str, int]] = {}
+        for row in counts:
+            stats.setdefault(row["_id"]["type"], {})[row["_id"]["status"]] = row["count"]
+        return stats
+
+
+class JobWorker:
+    def __init__(self, queue: JobQueue, concurrency: int = JOB_WORKERS, poll_interval: float = JOB_POLL_SECONDS):
+        self.queue = queue
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+        self.failed = 0
+        self.retried = 0
+        self.busy_seconds = 0.0
+        self._started = 0.0
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self, concurrency: Optional[int] = None):
+        concurrency = self.concurrency if concurrency is None else concurrency
+        if self._tasks or concurrency <= 0:
+            return
+        self._started = time.monotonic()
+        self._tasks = [asyncio.create_task(self._run(f"{self.worker_id}-{n}")) for n in range(concurrency)]
+        logger.info(f"Started {concurrency} job workers as {self.worker_id}")
+
+    async def stop(self):
+        # Jobs interrupted here are picked up again once their lease expires
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self):
+        await asyncio.gather(*self._tasks)
+
+    async def _run(self, worker_id: str):
+        while True:
+            # Any Mongo error, including while settling a job, must not end
+            # the worker; an unsettled job is retried once its lease expires
+            try:
+                job = await self.queue.claim(worker_id)
+                if job is not None:
+                    await self.process(job)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} error: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def process(self, job: Dict[str, Any]):
+        started = time.perf_counter()
+        try:
+            handler = handlers.get(job["type"])
+            if handler is None:
+                raise LookupError(f"No handler for job type {job['type']}")
+            if job["attempts"] > job["max_attempts"]:
+                raise RuntimeError("Lease expired after the last attempt")
+            await handler(job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status = await self.queue.fail(job, f"{type(e).__name__}: {e}")
+            if status == FAILED:
+                self.failed += 1
+                logger.error(f"Job {job['id']} ({job['type']}) failed permanently: {e}")
+            else:
+                self.retried += 1
+                logger.warning(f"Job {job['id']} ({job['type']}) will be retried: {e}")
+        else:
+            await self.queue.complete(job)
+            self.processed += 1
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+    def get_stats(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self._started if self._tasks else 0.0
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": len(self._tasks),
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "jobs_per_second": round(self.processed / uptime, 3) if uptime else 0.0,
+            "mean_job_ms": round(self.busy_seconds * 1000 / max(self.processed + self.retried + self.failed, 1), 3)
+        }
+
+
+# Initialize job queue and in-process worker instances
+job_queue = JobQueue()
+job_worker = JobWorker(job_queue)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    async def main():
+        await job_queue.ensure_indexes()
+        await database.ensure_badge_indexes()
+        job_worker.start(max(JOB_WORKERS, 1))
+        try:
+            await job_worker.join()
+        finally:
+            await job_worker.stop()
+            await database.close()
+
+    asyncio.run(main())
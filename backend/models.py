@@ -3,6 +3,9 @@ from typing import List, Optional, Dict, Any
 from datetime import datetime
 import uuid
 
+# Upper bound for step numbers sent by clients
+MAX_STEPS = 100
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     username: str
@@ -80,8 +83,8 @@ class UserProjectCreate(BaseModel):
     mode: str = "guided"
 
 class UserProjectUpdate(BaseModel):
-    progress: Optional[int] = None
-    current_step: Optional[int] = None
+    progress: Optional[int] = Field(default=None, ge=0, le=100)
+    current_step: Optional[int] = Field(default=None, ge=0, le=MAX_STEPS)
     is_completed: Optional[bool] = None
     mode: Optional[str] = None
     project_data: Optional[Dict[str, Any]] = None
@@ -104,11 +107,17 @@ class UserBadge(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     user_id: str
     badge_id: str
+    seen: bool = False  # Shown to the user via /my-badges/unseen/ack
     earned_at: datetime = Field(default_factory=datetime.utcnow)
 
 class ProgressUpdate(BaseModel):
     project_id: str
-    step: int
-    progress: int
+    step: int = Field(ge=0, le=MAX_STEPS)
+    progress: int = Field(ge=0, le=100)
     is_completed: bool = False
-    project_data: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    project_data: Optional[Dict[str, Any]] = None
+
+class TemplateRecommendation(BaseModel):
+    template: ProjectTemplate
+    score: float
+    reason: str  # similar, badge:<name> or popular
@@ -0,0 +1,266 @@
+import asyncio
+import contextvars
+import cProfile
+import functools
+import inspect
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from auth import verify_token, is_admin_email
+from database import database
+
+ROOT_DIR = Path(__file__).parent
+
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", ROOT_DIR / "profiles"))
+# Profile one in every N requests automatically; 0 disables sampling
+PROFILE_SAMPLE_EVERY = int(os.environ.get("PROFILE_SAMPLE_EVERY", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_ARTIFACTS = int(os.environ.get("PROFILE_MAX_ARTIFACTS", "300"))
+PROFILE_HEADER = b"x-profile"
+
+ARTIFACT_SUFFIXES = (".collapsed", ".pstats", ".json")
+
+current_profile: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar(
+    "current_profile", default=None
+)
+
+
+class StackSampler(threading.Thread):
+    """Periodically samples every thread's stack into collapsed-stack counts.
+
+    Each stack is rooted at its thread name, so work pushed to the executor
+    (analytics aggregates, recommendation ranking) shows up next to the event
+    loop. Concurrent requests served while a profile is running land in the
+    same trace, and idle executor threads appear as wait frames.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, mode: str):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", path).strip("-") or "root"
+        self.name = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{method.lower()}-{slug[:60]}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.mode = mode
+        self.status: Optional[int] = None
+        self.duration = 0.0
+        self.awaits: Dict[str, List[float]] = defaultdict(list)
+        self._sampler: Optional[StackSampler] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._started = 0.0
+
+    def record_await(self, label: str, seconds: float):
+        self.awaits[label].append(seconds)
+
+    def start(self):
+        if self.mode == "cprofile":
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        else:
+            self._sampler = StackSampler()
+            self._sampler.start()
+        self._started = time.perf_counter()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._sampler is not None:
+            self._sampler.stop()
+
+    def write(self, directory: Path):
+        directory.mkdir(parents=True, exist_ok=True)
+        if self._profiler is not None:
+            self._profiler.dump_stats(str(directory / f"{self.name}.pstats"))
+        if self._sampler is not None:
+            with open(directory / f"{self.name}.collapsed", "w") as f:
+                for stack, count in self._sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+        # Await timings are inclusive: a database call made from another
+        # instrumented call is counted under both labels
+        summary = {
+            "method": self.method,
+            "path": self.path,
+            "mode": self.mode,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 3),
+            "awaits": {
+                label: {
+                    "count": len(timings),
+                    "total_ms": round(sum(timings) * 1000, 3),
+                    "max_ms": round(max(timings) * 1000, 3)
+                }
+                for label, timings in sorted(self.awaits.items())
+            }
+        }
+        with open(directory / f"{self.name}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+
+        prune_artifacts(directory)
+
+
+def prune_artifacts(directory: Path, keep: int = PROFILE_MAX_ARTIFACTS):
+    artifacts = sorted(
+        (path for path in directory.iterdir() if path.suffix in ARTIFACT_SUFFIXES),
+        key=lambda path: path.stat().st_mtime,
+        reverse=True
+    )
+    for path in artifacts[keep:]:
+        path.unlink(missing_ok=True)
+
+
+def list_artifacts(directory: Path = PROFILE_DIR) -> List[Dict[str, Any]]:
+    if not directory.exists():
+        return []
+    artifacts = [path for path in directory.iterdir() if path.suffix in ARTIFACT_SUFFIXES]
+    artifacts.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    return [
+        {
+            "name": path.name,
+            "size": path.stat().st_size,
+            "created_at": datetime.utcfromtimestamp(path.stat().st_mtime)
+        }
+        for path in artifacts
+    ]
+
+
+def get_artifact_path(name: str, directory: Path = PROFILE_DIR) -> Optional[Path]:
+    # Only hand out files that are listed, never an arbitrary path
+    path = directory / name
+    if path.name != name or path.suffix not in ARTIFACT_SUFFIXES or not path.is_file():
+        return None
+    return path
+
+
+def instrument_awaits(target: Any, prefix: str):
+    """Wrap the coroutine methods of target so profiled requests record their await times."""
+    for name, method in inspect.getmembers(target, inspect.iscoroutinefunction):
+        if name.startswith("_"):
+            continue
+        setattr(target, name, _timed(method, f"{prefix}.{name}"))
+
+
+def _timed(func, label: str):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        profile = current_profile.get()
+        if profile is None:
+            return await func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            profile.record_await(label, time.perf_counter() - started)
+    return wrapper
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles requests on demand.
+
+    A request is profiled when an admin sends an ``X-Profile`` header
+    (``sample`` or ``cprofile``) or when it is picked by 1-in-N sampling.
+    Only one request is profiled at a time; requests that are not profiled
+    only pay for a header scan and a counter increment.
+    """
+
+    def __init__(self, app, directory: Path = PROFILE_DIR, sample_every: int = PROFILE_SAMPLE_EVERY):
+        self.app = app
+        self.directory = directory
+        self.sample_every = sample_every
+        self._counter = itertools.count(1)
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active:
+            await self.app(scope, receive, send)
+            return
+
+        mode = await self._requested_mode(scope)
+        if mode is None or self._active:
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        profile = RequestProfile(scope["method"], scope["path"], mode)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.name.encode())]
+            await send(message)
+
+        token = current_profile.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profile.stop()
+            current_profile.reset(token)
+            self._active = False
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, profile.write, self.directory)
+
+    async def _requested_mode(self, scope) -> Optional[str]:
+        requested = None
+        authorization = None
+        for key, value in scope["headers"]:
+            if key == PROFILE_HEADER:
+                requested = value
+            elif key == b"authorization":
+                authorization = value
+
+        if requested is not None:
+            mode = requested.decode("latin-1").strip().lower()
+            # Anonymous or malformed requests are turned away before any lookup
+            if mode in ("0", "false", "off") or authorization is None:
+                return None
+            scheme, _, token = authorization.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token or not await self._is_admin_token(token):
+                return None
+            return "cprofile" if mode == "cprofile" else "sample"
+
+        if self.sample_every and next(self._counter) % self.sample_every == 0:
+            return "sample"
+        return None
+
+    async def _is_admin_token(self, token: str) -> bool:
+        payload = verify_token(token)
+        if payload is None or payload.get("sub") is None:
+            return False
+        user = await database.get_user_by_id(payload["sub"])
+        return user is not None and is_admin_email(user.email)
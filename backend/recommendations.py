@@ -0,0 +1,418 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from database import database
+from models import Badge, ProjectTemplate, TemplateRecommendation
+
+logger = logging.getLogger(__name__)
+
+TOP_K = int(os.environ.get("RECOMMENDATIONS_TOP_K", "10"))
+CACHE_TTL_SECONDS = int(os.environ.get("RECOMMENDATIONS_CACHE_TTL_SECONDS", "600"))
+BATCH_SIZE = int(os.environ.get("RECOMMENDATIONS_BATCH_SIZE", "50000"))
+USER_BATCH_SIZE = int(os.environ.get("RECOMMENDATIONS_USER_BATCH_SIZE", "10000"))
+USER_CACHE_SIZE = int(os.environ.get("RECOMMENDATIONS_USER_CACHE_SIZE", "10000"))
+# How often the API process rebuilds neighbours and stored rankings; 0 leaves
+# it to running `python recommendations.py` from cron
+REBUILD_INTERVAL_HOURS = float(os.environ.get("RECOMMENDATIONS_REBUILD_HOURS", "24"))
+# Length of the ranked list stored per user; the endpoint's limit is capped to it
+MAX_RECOMMENDATIONS = 50
+
+# Relative weights of the signals combined in RecommendationModel.rank
+BADGE_WEIGHT = 0.5
+POPULARITY_WEIGHT = 0.1
+
+
+def co_completion_neighbors(user_ids: np.ndarray, template_ids: np.ndarray, top_k: int = TOP_K) -> List[Dict[str, Any]]:
+    """Top-K cosine neighbours per template from (user, template) completion pairs."""
+    if len(template_ids) == 0:
+        return []
+
+    user_codes, _ = pd.factorize(user_ids)
+    template_codes, templates = pd.factorize(template_ids)
+    completions = sparse.coo_matrix(
+        (np.ones(len(user_codes), dtype=np.float64), (user_codes, template_codes)),
+        shape=(user_codes.max() + 1, len(templates))
+    ).tocsr()
+    # A user completing the same template twice still counts once
+    completions.data[:] = 1.0
+
+    co_counts = (completions.T @ completions).toarray()
+    totals = np.diag(co_counts).copy()
+    norms = np.sqrt(totals)
+    similarity = co_counts / np.outer(norms, norms)
+    np.fill_diagonal(similarity, 0.0)
+
+    k = min(top_k, len(templates) - 1)
+    neighbors = []
+    for index, template_id in enumerate(templates):
+        row = similarity[index]
+        if k > 0:
+            top = np.argpartition(-row, k - 1)[:k]
+            top = top[np.argsort(-row[top])]
+            top = top[row[top] > 0]
+        else:
+            top = []
+        neighbors.append({
+            "template_id": template_id,
+            "completions": int(totals[index]),
+            "neighbors": [
+                {"template_id": templates[j], "score": float(row[j])}
+                for j in top
+            ],
+            "updated_at": datetime.utcnow()
+        })
+    return neighbors
+
+
+async def build_template_neighbors(top_k: int = TOP_K, batch_size: int = BATCH_SIZE) -> int:
+    """Offline job: rebuild the template_neighbors collection from completed projects."""
+    user_chunks, template_chunks = [], []
+    async for documents in database.iter_project_batches(
+        {"_id": 0, "user_id": 1, "template_id": 1},
+        query={"is_completed": True},
+        batch_size=batch_size
+    ):
+        frame = pd.DataFrame.from_records(documents, columns=["user_id", "template_id"])
+        user_chunks.append(frame["user_id"].to_numpy())
+        template_chunks.append(frame["template_id"].to_numpy())
+
+    if user_chunks:
+        user_ids = np.concatenate(user_chunks)
+        template_ids = np.concatenate(template_chunks)
+    else:
+        user_ids = template_ids = np.array([], dtype=object)
+
+    loop = asyncio.get_running_loop()
+    neighbors = await loop.run_in_executor(None, co_completion_neighbors, user_ids, template_ids, top_k)
+    await database.replace_template_neighbors(neighbors)
+    logger.info(f"Stored neighbours for {len(neighbors)} templates from {len(user_ids)} completions")
+    return len(neighbors)
+
+
+class RecommendationModel:
+    """Template-side ranking inputs as dense arrays indexed by template position."""
+
+    def __init__(self, templates: List[ProjectTemplate], neighbor_docs: List[Dict[str, Any]], badges: List[Badge]):
+        self.templates = templates
+        self.index = {template.id: i for i, template in enumerate(templates)}
+        n = len(templates)
+
+        self.similarity = np.zeros((n, n))
+        self.popularity = np.zeros(n)
+        most_completed = max([doc["completions"] for doc in neighbor_docs], default=0)
+        for doc in neighbor_docs:
+            i = self.index.get(doc["template_id"])
+            if i is None:
+                continue
+            if most_completed:
+                self.popularity[i] = doc["completions"] / most_completed
+            for neighbor in doc["neighbors"]:
+                j = self.index.get(neighbor["template_id"])
+                if j is not None:
+                    self.similarity[i, j] = neighbor["score"]
+
+        # Only category badges can be nudged towards by picking a template
+        self.badges = [badge for badge in badges if badge.requirements.get("type") == "category_projects"]
+        self.badge_index = {badge.id: k for k, badge in enumerate(self.badges)}
+        self.badge_categories = [badge.requirements.get("category", "").lower() for badge in self.badges]
+        self.badge_counts = np.array(
+            [max(badge.requirements.get("count", 1), 1) for badge in self.badges], dtype=np.float64
+        )
+        # templates x badges: 1 where the template is in the badge's category
+        self.badge_templates = np.array(
+            [[template.category.lower() == category for category in self.badge_categories] for template in templates],
+            dtype=np.float64
+        ).reshape(n, len(self.badges))
+
+    def rank(
+        self,
+        completed: np.ndarray,
+        started: np.ndarray,
+        category_completed: np.ndarray,
+        earned: np.ndarray,
+        limit: int = MAX_RECOMMENDATIONS
+    ) -> List[List[Dict[str, Any]]]:
+        """Ranked template lists for a block of users.
+
+        completed and started are users x templates 0/1 matrices,
+        category_completed counts each user's completed projects in every
+        badge's category and earned flags the badges a user already has.
+        """
+        n_users, n_templates = started.shape
+        if n_templates == 0:
+            return [[] for _ in range(n_users)]
+
+        similar = completed @ self.similarity
+        # Closer to an unearned badge means a bigger nudge
+        badge_boost = np.where(
+            (category_completed < self.badge_counts) & ~earned,
+            BADGE_WEIGHT * (category_completed + 1) / self.badge_counts,
+            0.0
+        )
+        badge = badge_boost @ self.badge_templates.T
+        scores = similar + badge + POPULARITY_WEIGHT * self.popularity
+        scores[started > 0] = -np.inf
+
+        k = min(limit, n_templates)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        ranked = []
+        for u in range(n_users):
+            row = top[u][np.argsort(-scores[u, top[u]])]
+            entries = []
+            for t in row[np.isfinite(scores[u, row])]:
+                if similar[u, t] > 0:
+                    reason = "similar"
+                elif badge[u, t] > 0:
+                    reason = f"badge:{self.badges[int(np.argmax(badge_boost[u] * self.badge_templates[t]))].name}"
+                elif self.popularity[t] > 0:
+                    reason = "popular"
+                else:
+                    # Nobody has completed it yet
+                    reason = "new"
+                entries.append({"template_id": self.templates[t].id, "score": float(scores[u, t]), "reason": reason})
+            ranked.append(entries)
+        return ranked
+
+    def user_inputs(self, projects: pd.DataFrame, earned: pd.DataFrame) -> Tuple[pd.Index, sparse.csr_matrix, sparse.csr_matrix, np.ndarray, np.ndarray]:
+        """Build rank() inputs from project (user_id, template_id, category,
+        is_completed) and earned badge (user_id, badge_id) rows.
+
+        Returns the user ids followed by the completed, started,
+        category_completed and earned matrices, one row per user.
+        """
+        user_codes, user_ids = pd.factorize(projects["user_id"])
+        shape = (len(user_ids), len(self.templates))
+
+        template_codes = projects["template_id"].map(self.index)
+        known = template_codes.notna().to_numpy()
+        rows = user_codes[known]
+        cols = template_codes[known].astype(int).to_numpy()
+        done = projects["is_completed"].fillna(False).astype(bool).to_numpy()
+
+        started = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=shape)
+        started.data[:] = 1.0
+        known_done = done[known]
+        completed = sparse.csr_matrix((np.ones(known_done.sum()), (rows[known_done], cols[known_done])), shape=shape)
+        completed.data[:] = 1.0
+
+        # Counted from the project's own category, like check_and_award_badges
+        categories = projects["category"].fillna("").astype(str).str.lower().to_numpy()
+        category_completed = np.zeros((len(user_ids), len(self.badges)))
+        for k, category in enumerate(self.badge_categories):
+            category_completed[:, k] = np.bincount(user_codes[done & (categories == category)], minlength=len(user_ids))
+
+        earned_matrix = np.zeros((len(user_ids), len(self.badges)), dtype=bool)
+        if len(earned):
+            users = pd.Index(user_ids).get_indexer(earned["user_id"])
+            badges = earned["badge_id"].map(self.badge_index)
+            mask = (users >= 0) & badges.notna().to_numpy()
+            earned_matrix[users[mask], badges[mask].astype(int).to_numpy()] = True
+
+        return user_ids, completed, started, category_completed, earned_matrix
+
+    def default_ranking(self) -> List[Dict[str, Any]]:
+        """Ranking for a user with no projects and no badges yet."""
+        n_templates, n_badges = len(self.templates), len(self.badges)
+        return self.rank(
+            np.zeros((1, n_templates)), np.zeros((1, n_templates)),
+            np.zeros((1, n_badges)), np.zeros((1, n_badges), dtype=bool)
+        )[0]
+
+
+PROJECT_COLUMNS = ["user_id", "template_id", "category", "is_completed"]
+EARNED_COLUMNS = ["user_id", "badge_id"]
+
+
+async def load_model() -> RecommendationModel:
+    return RecommendationModel(
+        await database.get_all_templates(),
+        await database.get_template_neighbors(),
+        await database.get_all_badges()
+    )
+
+
+async def build_user_recommendations(batch_size: int = BATCH_SIZE, user_batch_size: int = USER_BATCH_SIZE) -> int:
+    """Offline job: store a ranked template list for every user with projects."""
+    await database.ensure_recommendation_indexes()
+    model = await load_model()
+
+    project_chunks = []
+    async for documents in database.iter_project_batches(
+        {"_id": 0, **{column: 1 for column in PROJECT_COLUMNS}},
+        batch_size=batch_size
+    ):
+        project_chunks.append(pd.DataFrame.from_records(documents, columns=PROJECT_COLUMNS))
+    earned_chunks = []
+    async for documents in database.iter_user_badge_batches(batch_size=batch_size):
+        earned_chunks.append(pd.DataFrame.from_records(documents, columns=EARNED_COLUMNS))
+    projects = pd.concat(project_chunks, ignore_index=True) if project_chunks else pd.DataFrame(columns=PROJECT_COLUMNS)
+    earned = pd.concat(earned_chunks, ignore_index=True) if earned_chunks else pd.DataFrame(columns=EARNED_COLUMNS)
+
+    loop = asyncio.get_running_loop()
+    user_ids, completed, started, category_completed, earned_matrix = await loop.run_in_executor(
+        None, model.user_inputs, projects, earned
+    )
+    now = datetime.utcnow()
+    for lo in range(0, len(user_ids), user_batch_size):
+        hi = lo + user_batch_size
+        ranked = await loop.run_in_executor(
+            None, model.rank,
+            completed[lo:hi].toarray(), started[lo:hi].toarray(), category_completed[lo:hi], earned_matrix[lo:hi]
+        )
+        await database.save_user_recommendations([
+            {"user_id": user_id, "recommendations": entries, "updated_at": now}
+            for user_id, entries in zip(user_ids[lo:hi], ranked)
+        ])
+    logger.info(f"Stored recommendations for {len(user_ids)} users")
+    return len(user_ids)
+
+
+class Recommender:
+    """Serves precomputed per-user rankings from a small in-process LRU cache."""
+
+    def __init__(self, cache_ttl: int = CACHE_TTL_SECONDS, cache_size: int = USER_CACHE_SIZE):
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._model: Optional[RecommendationModel] = None
+        self._default: List[Dict[str, Any]] = []
+        self._model_expires = 0.0
+        self._users: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    async def get_model(self) -> RecommendationModel:
+        if self._model is not None and time.monotonic() < self._model_expires:
+            return self._model
+        async with self._lock:
+            if self._model is None or time.monotonic() >= self._model_expires:
+                self._model = await load_model()
+                self._default = self._model.default_ranking()
+                self._model_expires = time.monotonic() + self.cache_ttl
+        return self._model
+
+    def _cached(self, user_id: str) -> Optional[List[Dict[str, Any]]]:
+        cached = self._users.get(user_id)
+        if cached is None or time.monotonic() >= cached[0]:
+            return None
+        self._users.move_to_end(user_id)
+        return cached[1]
+
+    def _store(self, user_id: str, entries: List[Dict[str, Any]]):
+        self._users[user_id] = (time.monotonic() + self.cache_ttl, entries)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.cache_size:
+            self._users.popitem(last=False)
+
+    async def recommend(self, user_id: str, limit: int = 5) -> List[TemplateRecommendation]:
+        model = await self.get_model()
+        entries = self._cached(user_id)
+        if entries is None:
+            entries = await database.get_user_recommendations(user_id)
+            if entries is None:
+                # Not ranked by a rebuild or a job yet; the default ranking
+                # would suggest templates the user has already started
+                entries = await self.refresh_user(user_id)
+            else:
+                self._store(user_id, entries)
+
+        recommendations = []
+        for entry in entries:
+            index = model.index.get(entry["template_id"])
+            if index is None:
+                continue
+            recommendations.append(TemplateRecommendation(
+                template=model.templates[index],
+                score=entry["score"],
+                reason=entry["reason"]
+            ))
+            if len(recommendations) >= limit:
+                break
+        return recommendations
+
+    async def refresh_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """Recompute and store one user's ranking, e.g. after a project change."""
+        model = await self.get_model()
+        projects = pd.DataFrame.from_records(
+            await database.get_user_project_fields(user_id, PROJECT_COLUMNS), columns=PROJECT_COLUMNS
+        )
+        earned = pd.DataFrame(
+            {"user_id": user_id, "badge_id": await database.get_user_badge_ids(user_id)}, columns=EARNED_COLUMNS
+        )
+        user_ids, completed, started, category_completed, earned_matrix = model.user_inputs(projects, earned)
+        if len(user_ids):
+            entries = model.rank(completed.toarray(), started.toarray(), category_completed, earned_matrix)[0]
+        else:
+            entries = self._default
+        await database.save_user_recommendations([
+            {"user_id": user_id, "recommendations": entries, "updated_at": datetime.utcnow()}
+        ])
+        self._store(user_id, entries)
+        return entries
+
+
+async def rebuild_recommendations():
+    await build_template_neighbors()
+    await build_user_recommendations()
+
+
+class RecommendationRebuilder:
+    def __init__(self, interval_hours: float = REBUILD_INTERVAL_HOURS):
+        self.interval = interval_hours * 3600
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval <= 0 or self._task is not None:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        # Restarts only rebuild straight away when nothing was ever built
+        try:
+            if await database.get_template_neighbors():
+                await asyncio.sleep(self.interval)
+        except Exception as e:
+            logger.error(f"Error checking template neighbours: {e}")
+        while True:
+            try:
+                await rebuild_recommendations()
+            except Exception as e:
+                logger.error(f"Error rebuilding recommendations: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# Initialize recommender and rebuilder instances
+recommender = Recommender()
+rebuilder = RecommendationRebuilder()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+    async def main():
+        try:
+            await rebuild_recommendations()
+        finally:
+            await database.close()
+
+    asyncio.run(main())
@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query, status
+from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -12,10 +13,15 @@ from models import (
     User, UserCreate, UserLogin, UserResponse, 
     ProjectTemplate, ProjectTemplateCreate,
     UserProject, UserProjectCreate, UserProjectUpdate,
-    Badge, BadgeCreate, ProgressUpdate
+    Badge, BadgeCreate, ProgressUpdate, TemplateRecommendation
 )
 from database import database
-from auth import verify_password, get_password_hash, create_access_token, verify_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from analytics import analytics
+from recommendations import recommender, rebuilder, MAX_RECOMMENDATIONS
+from archiver import archiver
+from jobs import job_queue, job_worker
+from profiling import ProfilingMiddleware, instrument_awaits, list_artifacts, get_artifact_path
+from auth import verify_password, get_password_hash, create_access_token, verify_token, is_admin_email, ACCESS_TOKEN_EXPIRE_MINUTES
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -57,6 +63,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     return user
 
+async def get_admin_user(current_user: User = Depends(get_current_user)) -> User:
+    if not is_admin_email(current_user.email):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
 # Auth endpoints
 @api_router.post("/register", response_model=UserResponse)
 async def register(user_data: UserCreate):
@@ -157,10 +171,12 @@ async def create_user_project(
     
     created_project = await database.create_user_project(user_project)
     
-    # Update user's total projects count
-    await database.update_user(current_user.id, {
-        "total_projects": current_user.total_projects + 1
-    })
+    # Update user's total projects count in the background
+    await job_queue.enqueue(
+        "refresh_user_counters",
+        {"user_id": current_user.id},
+        idempotency_key=f"project-created:{created_project.id}"
+    )
     
     return created_project
 
@@ -169,19 +185,27 @@ async def get_user_project(
     project_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    project = await database.get_user_project_by_id(project_id)
+    project = await database.get_user_project_owner(project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
     
-    if project.user_id != current_user.id:
+    if project["user_id"] != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
     
+    # Only the owner's reads bring archived project data back to the hot tier
+    project = await database.get_user_project_by_id(project_id)
+    if not project:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Project not found"
+        )
+    
     return project
 
 @api_router.put("/projects/{project_id}", response_model=UserProject)
@@ -190,14 +214,14 @@ async def update_user_project(
     update_data: UserProjectUpdate,
     current_user: User = Depends(get_current_user)
 ):
-    project = await database.get_user_project_by_id(project_id)
+    project = await database.get_user_project_owner(project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
     
-    if project.user_id != current_user.id:
+    if project["user_id"] != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -207,14 +231,13 @@ async def update_user_project(
     update_dict = {k: v for k, v in update_data.dict().items() if v is not None}
     updated_project = await database.update_user_project(project_id, update_dict)
     
-    # If project is completed, update user's completed projects count
-    if update_data.is_completed and not project.is_completed:
-        await database.update_user(current_user.id, {
-            "completed_projects": current_user.completed_projects + 1
-        })
-        
-        # Check for new badges
-        await database.check_and_award_badges(current_user.id)
+    # If project is completed, update counters and check for new badges in the background
+    if update_data.is_completed and not project.get("is_completed") and updated_project:
+        await job_queue.enqueue(
+            "project_completed",
+            {"user_id": current_user.id},
+            idempotency_key=f"project-completed:{project_id}:{updated_project.updated_at.isoformat()}"
+        )
     
     return updated_project
 
@@ -224,14 +247,14 @@ async def update_project_progress(
     progress_data: ProgressUpdate,
     current_user: User = Depends(get_current_user)
 ):
-    project = await database.get_user_project_by_id(project_id)
+    project = await database.get_user_project_owner(project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
     
-    if project.user_id != current_user.id:
+    if project["user_id"] != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -249,35 +272,31 @@ async def update_project_progress(
     
     updated_project = await database.update_user_project(project_id, update_data)
     
-    # If project is completed, update user's completed projects count
-    if progress_data.is_completed and not project.is_completed:
-        await database.update_user(current_user.id, {
-            "completed_projects": current_user.completed_projects + 1
-        })
-        
-        # Check for new badges
-        new_badges = await database.check_and_award_badges(current_user.id)
-        
-        return {
-            "project": updated_project,
-            "new_badges": new_badges
-        }
+    # If project is completed, update counters and check for new badges in the
+    # background; clients poll /jobs/{job_id} and then /my-badges/unseen/ack
+    job_id = None
+    if progress_data.is_completed and not project.get("is_completed") and updated_project:
+        job_id = await job_queue.enqueue(
+            "project_completed",
+            {"user_id": current_user.id},
+            idempotency_key=f"project-completed:{project_id}:{updated_project.updated_at.isoformat()}"
+        )
     
-    return {"project": updated_project, "new_badges": []}
+    return {"project": updated_project, "job_id": job_id}
 
 @api_router.delete("/projects/{project_id}")
 async def delete_user_project(
     project_id: str,
     current_user: User = Depends(get_current_user)
 ):
-    project = await database.get_user_project_by_id(project_id)
+    project = await database.get_user_project_owner(project_id)
     if not project:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Project not found"
         )
     
-    if project.user_id != current_user.id:
+    if project["user_id"] != current_user.id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
@@ -290,10 +309,12 @@ async def delete_user_project(
             detail="Failed to delete project"
         )
     
-    # Update user's total projects count
-    await database.update_user(current_user.id, {
-        "total_projects": current_user.total_projects - 1
-    })
+    # Update user's total projects count in the background
+    await job_queue.enqueue(
+        "refresh_user_counters",
+        {"user_id": current_user.id},
+        idempotency_key=f"project-deleted:{project_id}"
+    )
     
     return {"message": "Project deleted successfully"}
 
@@ -306,11 +327,80 @@ async def get_all_badges():
 async def get_user_badges(current_user: User = Depends(get_current_user)):
     return await database.get_user_badges(current_user.id)
 
+@api_router.post("/my-badges/unseen/ack", response_model=List[Badge])
+async def ack_unseen_badges(current_user: User = Depends(get_current_user)):
+    return await database.ack_unseen_badges(current_user.id)
+
 @api_router.post("/badges", response_model=Badge)
 async def create_badge(badge_data: BadgeCreate):
     badge = Badge(**badge_data.dict())
     return await database.create_badge(badge)
 
+# Recommendation endpoints
+@api_router.get("/recommendations", response_model=List[TemplateRecommendation])
+async def get_recommendations(
+    limit: int = Query(5, ge=1, le=MAX_RECOMMENDATIONS),
+    current_user: User = Depends(get_current_user)
+):
+    return await recommender.recommend(current_user.id, limit=limit)
+
+# Analytics endpoints
+@api_router.get("/analytics/summary")
+async def get_analytics_summary(refresh: bool = False, admin_user: User = Depends(get_admin_user)):
+    return await analytics.get_summary(refresh=refresh)
+
+@api_router.get("/analytics/projects.csv")
+async def export_projects_csv(admin_user: User = Depends(get_admin_user)):
+    return StreamingResponse(
+        analytics.stream_csv(),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=projects.csv"}
+    )
+
+@api_router.get("/analytics/projects.parquet")
+async def export_projects_parquet(admin_user: User = Depends(get_admin_user)):
+    return StreamingResponse(
+        analytics.stream_parquet(),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": "attachment; filename=projects.parquet"}
+    )
+
+# Profiling endpoints
+@api_router.get("/admin/profiles")
+async def get_profiles(admin_user: User = Depends(get_admin_user)):
+    return list_artifacts()
+
+@api_router.get("/admin/profiles/{name}")
+async def download_profile(name: str, admin_user: User = Depends(get_admin_user)):
+    path = get_artifact_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, filename=name)
+
+@api_router.get("/admin/tiering")
+async def get_tiering_stats(admin_user: User = Depends(get_admin_user)):
+    return await database.get_tier_stats()
+
+@api_router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str, current_user: User = Depends(get_current_user)):
+    job = await job_queue.get_job(job_id)
+    if not job or job["payload"].get("user_id") != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return {"id": job["id"], "type": job["type"], "status": job["status"]}
+
+@api_router.get("/admin/jobs")
+async def get_job_stats(admin_user: User = Depends(get_admin_user)):
+    return {
+        "queue": await job_queue.get_stats(),
+        "worker": job_worker.get_stats()
+    }
+
 # Health check
 @api_router.get("/health")
 async def health_check():
@@ -327,6 +417,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Profiling is added last so it wraps everything, and database awaits are
+# timed only while a profiled request is running
+app.add_middleware(ProfilingMiddleware)
+instrument_awaits(database, "database")
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -339,10 +434,24 @@ async def startup_event():
     logger.info("Starting ScratchKids API...")
     # Initialize default templates and badges
     await initialize_default_data()
+    await job_queue.ensure_indexes()
+    await database.ensure_recommendation_indexes()
+    await database.ensure_project_indexes()
+    try:
+        await database.ensure_badge_indexes()
+    except Exception as e:
+        # Existing duplicate awards block the unique index until cleaned up
+        logger.error(f"Error creating badge indexes: {e}")
+    job_worker.start()
+    archiver.start()
+    rebuilder.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down ScratchKids API...")
+    await rebuilder.stop()
+    await archiver.stop()
+    await job_worker.stop()
     await database.close()
 
 async def initialize_default_data():
@@ -28,7 +28,7 @@ const Dashboard = () => {
   const [loading, setLoading] = useState(true);
   const [showAuthModal, setShowAuthModal] = useState(false);
   
-  const { user, isAuthenticated, isGuest } = useAuth();
+  const { user, isAuthenticated, isGuest, refreshUser } = useAuth();
 
   const categories = [
     { id: 'all', name: 'All Projects', icon: '🎯' },
@@ -142,6 +142,34 @@ const Dashboard = () => {
     }
   };
 
+  // Completion side effects (counters, badges) run as a background job on the
+  // server; wait briefly for it before showing new badges
+  const waitForJob = async (jobId, attempts = 10, delayMs = 500) => {
+    for (let i = 0; i < attempts; i++) {
+      try {
+        const response = await axios.get(`${API}/jobs/${jobId}`);
+        if (response.data.status === 'done' || response.data.status === 'failed') {
+          return;
+        }
+      } catch (error) {
+        return;
+      }
+      await new Promise((resolve) => setTimeout(resolve, delayMs));
+    }
+  };
+
+  const showCompletionResults = async (jobId) => {
+    try {
+      await waitForJob(jobId);
+      const unseenRes = await axios.post(`${API}/my-badges/unseen/ack`);
+      unseenRes.data.forEach(() => playBadge());
+      await refreshUser();
+      await loadUserData();
+    } catch (error) {
+      console.error('Error loading new badges:', error);
+    }
+  };
+
   const handleContinueProject = (project) => {
     playClick();
     setSelectedProject(project);
@@ -192,13 +220,14 @@ const Dashboard = () => {
           playStep();
         }
         
-        // Check for new badges
-        if (response.data.new_badges && response.data.new_badges.length > 0) {
-          response.data.new_badges.forEach(() => playBadge());
-        }
-        
         // Refresh user data
         await loadUserData();
+        
+        // Check for new badges once the completion job has run, without
+        // holding up the dashboard refresh
+        if (response.data.job_id) {
+          showCompletionResults(response.data.job_id);
+        }
       }
       
       console.log(`Progress saved for project ${projectId}, step ${step}`);
@@ -176,8 +176,19 @@ export const AuthProvider = ({ children }) => {
     }
   };
 
+  const refreshUser = async () => {
+    if (!token || isGuest) return;
+    try {
+      const response = await axios.get(`${API}/me`);
+      setUser(response.data);
+    } catch (error) {
+      console.error('Error refreshing user:', error);
+    }
+  };
+
   const value = {
     user,
+    refreshUser,
     login,
     register,
     loginAsGuest,